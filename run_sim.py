@@ -1,14 +1,19 @@
 
 import asyncio, configparser, argparse, csv
+from contextlib import AsyncExitStack, nullcontext
+from urllib.parse import urlsplit
 
 from asyncua import Server, Client
 from asyncua.common.structures104 import load_enums, load_custom_struct
 
 from simopc import parse_feed, stations, setup_basic_model, setup_tmc_model
+from simopc import Recorder, read_header, replay_log, LatencyProbe, PhaseProfiler
+from simopc import make_sink, OpcSink
 
 
-async def main(args, usage):
+async def main(args, usage, profiler):
 
+	profiler.start("config")
 	setup = args.preset
 	config = configparser.ConfigParser()
 	defaults = {
@@ -49,39 +54,60 @@ async def main(args, usage):
 
 	hosting = False if args.client else not config[setup].getboolean('write_as_client')
 	use_tmc = True if args.tmc_model else config[setup].getboolean('use_tmc')
-	endpoint = args.endpoint if args.endpoint else config[setup]['endpoint']
+	endpoints = args.endpoint if args.endpoint else [config[setup]['endpoint']]
+	endpoint = endpoints[0]
 	feed_file = args.feed_file if args.feed_file else config[setup]['feed_filepath']
 	speed = float(args.speed) if args.speed else config[setup].getfloat('playback_speed')
 	speed = 60 / speed if speed > 0 else 0
 	skip_to = float(args.skip) if args.skip else config[setup].getfloat('skip_to_time')
 	fast_forward_to = float(args.start) if args.start else config[setup].getfloat('start_timestamp')
 
-	if not endpoint:
+	if args.replay and (args.sink != "opc" or args.latency_probe or args.record
+						or args.skip or args.feed_file):
+		print(usage)
+		print("-o, -l, -r, -s and -f can't be used when replaying a log with -R LOG_FILE\n")
+		return 2
+
+	try:
+		sink = make_sink(args.sink)
+	except ValueError as e:
+		print(usage)
+		print(f"{e}\n")
+		return 2
+	use_opc = isinstance(sink, OpcSink)
+
+	# Other sinks still read types and node names from a client session, or when
+	# hosting from the address space of a server that is never started
+	connect = use_opc or not hosting
+
+	if not endpoint and connect:
 		print(usage)
 		print("No endpoint specified, use -e ENDPOINT or 'endpoint = ENDPOINT' in presets.cfg\n")
 		return 2
 
+	if len(endpoints) > 1 and not args.replay:
+		print(usage)
+		print("Multiple endpoints can only be used when replaying a log with -R LOG_FILE\n")
+		return 2
+
+	if args.latency_probe and not use_opc:
+		print(usage)
+		print("The latency probe needs the opc sink to subscribe to\n")
+		return 2
+
 	if altered_defaults:
 		print(f"WARNING: Preset defaults have been altered, delete [DEFAULT] section to restore")
 
-	if hosting:
-		server = Server()
-		await server.init()
-		server.set_server_name("Python Sim")
-		server.set_endpoint(endpoint)
-
-		if use_tmc:
-			await server.import_xml("nodesets/DI.xml")
-			await server.import_xml("nodesets/PackML.xml")
-			await server.import_xml("nodesets/TMC.xml")
-		else:
-			await server.import_xml("nodesets/simbasic.xml")
-		session = server
+	if args.replay:
+		return await replay(args.replay, endpoints, hosting, speed, fast_forward_to, usage,
+							profiler)
 
-	else:
-		session = Client(endpoint)
+	profiler.start("import")
+	session = await open_session(endpoint, hosting, use_tmc)
 
-	async with session:
+	profiler.start("connect")
+	async with (session if connect else nullcontext(session)):
+		profiler.start("types")
 		if (use_tmc):
 			tmc = await session.get_namespace_index("http://opcfoundation.org/UA/TMC/v2/")
 			idx = await session.get_namespace_index("http://sandhillconsulting.net/UA/SimInstances/")
@@ -91,10 +117,42 @@ async def main(args, usage):
 			await load_custom_struct(session.get_node(f"ns={tmc};i=3010")) # MaterialDefinitionType
 			await load_custom_struct(session.get_node(f"ns={tmc};i=3012")) # MaterialLotType
 			await load_custom_struct(session.get_node(f"ns={tmc};i=3025")) # MaterialSublotType
+			probe_branches = [[f"{tmc}:LiveStatus"],
+							  [f"{tmc}:MaterialOutputPoints", f"{idx}:MaterialOutput"]]
 		else:
 			idx = await session.get_namespace_index("http://sandhillconsulting.net/UA/SimBasic/")
-
-		assembly = await session.nodes.objects.get_child(f"{idx}:AssemblyLine")
+			probe_branches = [[f"{idx}:LiveStatus"], [f"{idx}:OutputPoint"]]
+
+		profiler.start("instrument")
+		assembly = await sink.get_root(session, f"{idx}:AssemblyLine")
+		on_event = [sink.set_time]
+		recorder = None
+		if args.record:
+			namespaces = await session.get_namespace_array()
+			# Only the model's namespaces have to exist on the servers a log is replayed to
+			used = {0, idx, tmc} if use_tmc else {0, idx}
+			namespaces = [uri if i in used else "" for i, uri in enumerate(namespaces)]
+			recorder = Recorder(open(args.record, 'wb'), namespaces, use_tmc)
+			assembly = recorder.wrap(assembly, f"{idx}:AssemblyLine")
+			on_event.append(recorder.set_time)
+
+		probe = None
+		if args.latency_probe:
+			probe_endpoint = local_endpoint(endpoint) if hosting else endpoint
+			probe = LatencyProbe(Client(probe_endpoint), args.publish_interval,
+								 args.subscription_size)
+			try:
+				await probe.start(f"{idx}:AssemblyLine", [f"{idx}:{name}" for name in stations],
+								  probe_branches)
+			except ValueError as e:
+				print(usage)
+				print(f"{e}\n")
+				return 2
+			assembly = probe.wrap(assembly, f"{idx}:AssemblyLine")
+			on_event.append(probe.set_time)
+			report_task = asyncio.create_task(probe.report_every(10))
+
+		profiler.start("discovery")
 		nodes = {name: await assembly.get_child(f"{idx}:{name}")
 				 for name in stations}
 
@@ -103,6 +161,7 @@ async def main(args, usage):
 		else:
 			await setup_basic_model(nodes, idx)
 
+		profiler.start("skip")
 		with open(feed_file, 'r') as f:
 			fieldnames = f.readline().rstrip().split(',')
 
@@ -123,10 +182,92 @@ async def main(args, usage):
 			if speed != 60.0:
 				message += f" at {speed} seconds per timestamp unit"
 			print(f"{message}...\n")
+			profiler.stop()
+			if use_opc:
+				await asyncio.sleep(5)
+
+			profiler.start("fast_forward")
+			await parse_feed(reader, stations, wait=speed, start=fast_forward_to,
+							 on_event=on_event, on_live=[profiler.start_live])
+			profiler.finish()
+			print("End of data feed")
+			if probe:
+				report_task.cancel()
+				await probe.stop()
+			if recorder:
+				recorder.close()
+				print(f"Recorded writes to {args.record}")
+			await sink.close()
+			while use_opc:
+				await asyncio.sleep(1)
+
+
+async def open_session(endpoint, hosting, use_tmc):
+
+	if hosting:
+		server = Server()
+		await server.init()
+		server.set_server_name("Python Sim")
+		server.set_endpoint(endpoint)
+
+		if use_tmc:
+			await server.import_xml("nodesets/DI.xml")
+			await server.import_xml("nodesets/PackML.xml")
+			await server.import_xml("nodesets/TMC.xml")
+		else:
+			await server.import_xml("nodesets/simbasic.xml")
+		return server
+
+	return Client(endpoint)
+
+
+def local_endpoint(endpoint):
+	# A server listening on all interfaces can't be connected to at its wildcard address
+	url = urlsplit(endpoint)
+	if url.hostname in {"0.0.0.0", "::", ""}:
+		port = f":{url.port}" if url.port else ""
+		url = url._replace(netloc=f"127.0.0.1{port}")
+	return url.geturl()
+
+
+async def replay(log_file, endpoints, hosting, speed, fast_forward_to, usage, profiler):
+
+	with open(log_file, 'rb') as f:
+		try:
+			namespaces, use_tmc = read_header(f)
+		except ValueError as e:
+			print(usage)
+			print(f"{e}\n")
+			return 2
+
+		profiler.start("import")
+		# Only the first endpoint can be hosted, the rest are written to as a client
+		sessions = [await open_session(endpoint, hosting and i == 0, use_tmc)
+					for i, endpoint in enumerate(endpoints)]
+
+		profiler.start("connect")
+		async with AsyncExitStack() as stack:
+			for session in sessions:
+				await stack.enter_async_context(session)
+
+			message = f"Replaying {'TMC ' if use_tmc else ''}log {log_file} "
+			message += f"to {len(sessions)} endpoint(s) from t={fast_forward_to}"
+			if speed != 60.0:
+				message += f" at {speed} seconds per timestamp unit"
+			print(f"{message}...\n")
+			profiler.stop()
 			await asyncio.sleep(5)
 
-			await parse_feed(reader, stations, wait=speed, start=fast_forward_to)
-			print("End of data feed")
+			profiler.start("replay")
+			try:
+				count = await replay_log(f, namespaces, sessions, wait=speed,
+										 start=fast_forward_to)
+			except ValueError as e:
+				print(usage)
+				print(f"{e}\n")
+				return 2
+			profiler.finish()
+			print(f"End of recorded log, {count} writes replayed")
 			while True:
 				await asyncio.sleep(1)
 
@@ -171,8 +312,9 @@ def parse_arguments():
 						help="Use the TMC-based model instead of the basic model")
 	parser.add_argument("-c", "--client", action="store_true",
 						help="Write the data to a separate server as a Python client")
-	parser.add_argument("-e", metavar="ENDPOINT", dest="endpoint",
-						help="Endpoint to host / Endpoint to target as client")
+	parser.add_argument("-e", metavar="ENDPOINT", dest="endpoint", action="append",
+						help="Endpoint to host / Endpoint to target as client "
+						"(repeat to replay a log to several servers)")
 	parser.add_argument("-n", metavar="NAME", dest="server_name",
 						help="Name to use for Python server (if hosting)")
 	parser.add_argument("-f", metavar="FEED_FILE", dest="feed_file",
@@ -183,10 +325,40 @@ def parse_arguments():
 						help="Begin live playback by fast-forwarding to given time")
 	parser.add_argument("-x", metavar="SPEED", dest="speed",
 						help="Playback speed multiplier")
+	parser.add_argument("-r", "--record", metavar="LOG_FILE", dest="record",
+						help="Record every value written during playback to a binary log")
+	parser.add_argument("-R", "--replay", metavar="LOG_FILE", dest="replay",
+						help="Replay a recorded log instead of running the model")
+	parser.add_argument("-o", "--sink", metavar="SINK", default="opc",
+						help="Where to write values: opc, memory, file:PATH or udp:HOST:PORT")
+	parser.add_argument("--profile", metavar="DIR",
+						help="Write a timing and profile report for each phase of the run to DIR")
+	parser.add_argument("--profiler", default="cprofile",
+						choices=["cprofile", "sample", "tracemalloc", "none"],
+						help="Profiler attached to each phase with --profile")
+	parser.add_argument("-l", "--latency_probe", action="store_true",
+						help="Subscribe to the written variables and report notification latency")
+	parser.add_argument("--publish_interval", metavar="MS", type=float, default=100.0,
+						help="Publishing interval of the latency probe subscriptions")
+	parser.add_argument("--subscription_size", metavar="N", type=int, default=0,
+						help="Monitored items per latency probe subscription (0 for all in one)")
 	args = parser.parse_args()
+	if args.publish_interval <= 0:
+		parser.error("--publish_interval must be greater than 0")
+	if args.subscription_size < 0:
+		parser.error("--subscription_size must be 0 or more")
 	return args, parser.format_help()
 
 
 if __name__ == "__main__":
 	args, usage = parse_arguments()
-	asyncio.run(main(args, usage))
+	try:
+		profiler = PhaseProfiler(args.profile, args.profiler)
+	except ValueError as e:
+		print(usage)
+		print(f"{e}\n")
+	else:
+		try:
+			asyncio.run(main(args, usage, profiler))
+		finally:
+			profiler.finish()
@@ -3,3 +3,7 @@ from .parse_feed import parse_feed, Queue, Activity
 from .sim_common import stations
 from .basic_model import setup_basic_model
 from .tmc_model import setup_tmc_model
+from .recording import Recorder, read_header, replay_log
+from .latency_probe import LatencyProbe
+from .sinks import OpcSink, MemorySink, FileSink, UdpSink, make_sink
+from .profiling import PhaseProfiler
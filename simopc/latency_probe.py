@@ -0,0 +1,131 @@
+import asyncio, statistics, time
+from collections import deque
+
+from asyncua import ua
+
+from .write_tap import tap_writes
+
+
+class _Handler:
+	def __init__(self, probe):
+		self.probe = probe
+
+	def datachange_notification(self, node, val, data):
+		self.probe.notify(node, data.monitored_item.Value)
+
+
+class LatencyProbe:
+	"""
+	Subscribes to the written variables through its own client and measures the
+	delay from parse_feed scheduling an event to the matching data change
+	notification. Writes are correlated by the SourceTimestamp stamped on them.
+	"""
+	def __init__(self, client, publish_interval=100.0, subscription_size=0):
+		self.client = client
+		self.publish_interval = publish_interval
+		self.subscription_size = subscription_size
+		self.subscriptions = []
+		self.node_paths = {}
+		self.pending = {}
+		self.last_values = {}
+		self.scheduled = None
+		self.sim_time = 0.0
+		self.latencies = []
+		self.writes = 0
+		self.coalesced = 0
+		self.unmatched = 0
+
+	def wrap(self, node, path):
+		return tap_writes(node, path, self.record)
+
+	def set_time(self, event_lines):
+		self.sim_time = float(event_lines[0]['Timestamp'])
+		self.scheduled = time.perf_counter()
+
+	def record(self, path, dv):
+		key = "/".join(path)
+		# The server only notifies on a change of value
+		if self.last_values.get(key) == dv.Value:
+			return
+		self.last_values[key] = dv.Value
+		scheduled = self.scheduled if self.scheduled is not None else time.perf_counter()
+		self.pending.setdefault(key, deque()).append((dv.SourceTimestamp, scheduled, self.sim_time))
+		self.writes += 1
+
+	def notify(self, node, dv):
+		received = time.perf_counter()
+		pending = self.pending.get(self.node_paths.get(node.nodeid.to_string()))
+		if not pending or dv.SourceTimestamp not in (entry[0] for entry in pending):
+			self.unmatched += 1 # Initial values and writes from elsewhere
+			return
+		# Anything written before the notified value was merged into it
+		while (entry := pending.popleft())[0] != dv.SourceTimestamp:
+			self.coalesced += 1
+		self.latencies.append(received - entry[1])
+
+	async def browse_variables(self, node, path, variables):
+		for ref in await node.get_children_descriptions():
+			if ref.NodeClass not in {ua.NodeClass.Object, ua.NodeClass.Variable}:
+				continue
+			child = self.client.get_node(ref.NodeId)
+			child_path = path + [ref.BrowseName.to_string()]
+			if ref.NodeClass == ua.NodeClass.Variable:
+				variables.append(child)
+				self.node_paths[ref.NodeId.to_string()] = "/".join(child_path)
+			await self.browse_variables(child, child_path, variables)
+
+	async def start(self, assembly_path, station_names, branches):
+		"""
+		assembly_path = browse name of the AssemblyLine folder under Objects
+		station_names = browse names of the stations within it
+		branches = relative paths from each station to the subtrees to monitor
+		"""
+		await self.client.connect()
+		assembly = await self.client.nodes.objects.get_child(assembly_path)
+		variables = []
+		for name in station_names:
+			station = await assembly.get_child(name)
+			for branch in branches:
+				node = await station.get_child(branch)
+				path = [assembly_path, name] + branch
+				await self.browse_variables(node, path, variables)
+
+		if not variables:
+			await self.client.disconnect()
+			raise ValueError(f"No variables found to monitor under {assembly_path}")
+
+		size = self.subscription_size or len(variables)
+		for i in range(0, len(variables), size):
+			sub = await self.client.create_subscription(self.publish_interval, _Handler(self))
+			await sub.subscribe_data_change(variables[i:i + size])
+			self.subscriptions.append(sub)
+
+		# Writes of the value a variable already holds are never notified
+		for node, dv in zip(variables, await self.client.read_attributes(variables)):
+			self.last_values[self.node_paths[node.nodeid.to_string()]] = dv.Value
+
+		print(f"Latency probe monitoring {len(variables)} variables in "
+			  f"{len(self.subscriptions)} subscription(s) at {self.publish_interval} ms")
+
+	async def stop(self):
+		# Give notifications for the last writes a chance to arrive
+		await asyncio.sleep(self.publish_interval * 2 / 1000)
+		self.report(final=True)
+		await self.client.disconnect()
+
+	async def report_every(self, period):
+		while True:
+			await asyncio.sleep(period)
+			self.report()
+
+	def report(self, final=False):
+		awaiting = sum(len(pending) for pending in self.pending.values())
+		message = f"Latency probe at t={self.sim_time}: {self.writes} writes, "
+		message += f"{len(self.latencies)} notified, {self.coalesced} coalesced, "
+		message += f"{awaiting} {'missing' if final else 'awaiting'}, "
+		message += f"{self.unmatched} unmatched notifications"
+		if len(self.latencies) > 1:
+			cuts = statistics.quantiles(self.latencies, n=100, method="inclusive")
+			message += f"\n  latency ms: p50={cuts[49] * 1000:.2f} p90={cuts[89] * 1000:.2f}"
+			message += f" p99={cuts[98] * 1000:.2f} max={max(self.latencies) * 1000:.2f}"
+		print(message)
@@ -73,7 +73,12 @@ class Activity:
 		self.last_timestamp = timestamp
 
 
-async def process_event(event_lines, objects):
+async def process_event(event_lines, objects, on_event=()):
+	for func in on_event:
+		if asyncio.iscoroutinefunction(func):
+			await func(event_lines)
+		else:
+			func(event_lines)
 	state_changes = {}
 	for line in event_lines:
 		name = line['Object']
@@ -90,12 +95,16 @@ async def process_event(event_lines, objects):
 			await objects[name].state_update(line)
 
 
-async def parse_feed(reader, objects={}, wait=0, start=0, add_untracked_objects=False):
+async def parse_feed(reader, objects={}, wait=0, start=0, add_untracked_objects=False,
+					 on_event=(), on_live=()):
 	"""
 	reader = csv.Dictreader object
 	objects = dict of {name: Activity/Queue object}
 	wait = seconds to wait per timestamp unit
 	start = starting timestamp to fast forward to
+	on_event = functions called with the lines of each event before it is processed
+	on_live = functions called with the lines of the first event after start, before
+			  waiting for it
 	"""
 	line = next(reader)
 	while not line['Timestamp']:
@@ -120,20 +129,25 @@ async def parse_feed(reader, objects={}, wait=0, start=0, add_untracked_objects=
 			if fast_forward:
 				if event_time > start:
 					fast_forward = False
+					for func in on_live:
+						if asyncio.iscoroutinefunction(func):
+							await func(event_lines)
+						else:
+							func(event_lines)
 					last_event_time = event_time
 					sleeptime = event_time - start
 					await asyncio.sleep(wait * sleeptime)
-				await process_event(event_lines, objects)
+				await process_event(event_lines, objects, on_event)
 			else:
 				sleeptime = event_time - last_event_time
 				await asyncio.sleep(wait * sleeptime)
-				await process_event(event_lines, objects)
+				await process_event(event_lines, objects, on_event)
 				last_event_time = event_time
 			event_lines = [line]
 			timestamp = line['Timestamp']
 
 	if event_lines:
-		await process_event(event_lines, objects)
+		await process_event(event_lines, objects, on_event)
 
 	return objects
 
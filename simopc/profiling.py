@@ -0,0 +1,175 @@
+import cProfile, glob, io, os, pstats, signal, sys, time, tracemalloc
+from collections import Counter
+
+try:
+	import resource
+except ImportError: # Not available on Windows
+	resource = None
+
+
+class Tracer(cProfile.Profile):
+	"""Deterministic profiler reporting the top functions by cumulative time"""
+	def report(self, f, top, path):
+		self.dump_stats(f"{path}.prof")
+		stream = io.StringIO()
+		pstats.Stats(self, stream=stream).sort_stats('cumulative').print_stats(top)
+		f.write(stream.getvalue())
+
+
+class Sampler:
+	"""Statistical profiler sampling the running stack on a CPU time interval"""
+	def __init__(self, interval=0.005):
+		self.interval = interval
+		self.own = Counter()
+		self.total = Counter()
+		self.samples = 0
+
+	def sample(self, signum, frame):
+		self.samples += 1
+		seen = set()
+		self.own[self.label(frame)] += 1
+		while frame is not None:
+			label = self.label(frame)
+			if label not in seen:
+				self.total[label] += 1
+				seen.add(label)
+			frame = frame.f_back
+
+	@staticmethod
+	def label(frame):
+		code = frame.f_code
+		return f"{code.co_filename}:{code.co_firstlineno}({code.co_name})"
+
+	def enable(self):
+		signal.signal(signal.SIGPROF, self.sample)
+		signal.setitimer(signal.ITIMER_PROF, self.interval, self.interval)
+
+	def disable(self):
+		signal.setitimer(signal.ITIMER_PROF, 0)
+		signal.signal(signal.SIGPROF, signal.SIG_DFL)
+
+	def report(self, f, top, path):
+		f.write(f"{self.samples} samples every {self.interval * 1000} ms of CPU time\n\n")
+		f.write("  own   total  function\n")
+		for label, count in self.own.most_common(top):
+			f.write(f"{count:>5} {self.total[label]:>7}  {label}\n")
+
+
+class AllocationTracer:
+	"""Traces the memory allocated during a phase that is still held at its end"""
+	def __init__(self):
+		self.snapshot = None
+		self.peak = 0
+
+	def enable(self):
+		tracemalloc.start()
+
+	def disable(self):
+		self.peak = tracemalloc.get_traced_memory()[1]
+		self.snapshot = tracemalloc.take_snapshot()
+		tracemalloc.stop()
+
+	def report(self, f, top, path):
+		stats = self.snapshot.statistics('lineno')
+		total = sum(stat.size for stat in stats)
+		f.write(f"Traced {total / 1024:.1f} KiB held, {self.peak / 1024:.1f} KiB peak\n\n")
+		for stat in stats[:top]:
+			f.write(f"{stat}\n")
+
+
+profilers = {
+	"cprofile": Tracer,
+	"sample": Sampler,
+	"tracemalloc": AllocationTracer,
+}
+
+
+class Phase:
+	def __init__(self, name, profiler):
+		self.name = name
+		self.profiler = profiler
+		self.blocks = sys.getallocatedblocks()
+		self.wall = time.perf_counter()
+		self.cpu = time.process_time()
+		if profiler:
+			profiler.enable()
+
+	def end(self):
+		if self.profiler:
+			self.profiler.disable()
+		self.wall = time.perf_counter() - self.wall
+		self.cpu = time.process_time() - self.cpu
+		self.blocks = sys.getallocatedblocks() - self.blocks
+		self.max_rss = None
+		if resource:
+			# Reported in bytes on macOS and KiB elsewhere
+			max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+			self.max_rss = max_rss if sys.platform == "darwin" else max_rss * 1024
+
+
+class PhaseProfiler:
+	"""
+	Times each phase of a run and writes a report for each to a directory
+	directory = where to write reports, or None to disable profiling
+	profiler = 'cprofile', 'sample', 'tracemalloc' or 'none' to attach to each phase
+	"""
+	def __init__(self, directory=None, profiler="cprofile", top=25):
+		if directory and profiler == "sample" and not hasattr(signal, "SIGPROF"):
+			raise ValueError("The sample profiler needs SIGPROF, which this platform "
+							 "does not have: use --profiler cprofile instead")
+		self.directory = directory
+		self.profiler = profilers.get(profiler)
+		self.top = top
+		self.phases = []
+		self.current = None
+		if directory:
+			os.makedirs(directory, exist_ok=True)
+			# Reports of an earlier run may have other phases under the same numbers
+			for pattern in ("[0-9][0-9]-*.txt", "[0-9][0-9]-*.prof", "summary.txt"):
+				for path in glob.glob(os.path.join(glob.escape(directory), pattern)):
+					os.remove(path)
+
+	def start(self, name):
+		if not self.directory:
+			return
+		self.stop()
+		self.current = Phase(name, self.profiler() if self.profiler else None)
+
+	def stop(self):
+		if self.current:
+			self.current.end()
+			self.write_report(len(self.phases), self.current)
+			self.phases.append(self.current)
+			self.current = None
+
+	def start_live(self, event_lines):
+		"""on_live function for parse_feed"""
+		self.start("live")
+
+	def write_report(self, i, phase):
+		path = os.path.join(self.directory, f"{i:02}-{phase.name}")
+		with open(f"{path}.txt", 'w') as f:
+			f.write(f"Phase: {phase.name}\n")
+			f.write(f"Wall time: {phase.wall:.3f} s\n")
+			f.write(f"CPU time: {phase.cpu:.3f} s\n")
+			f.write(f"Allocated blocks: {phase.blocks:+}\n")
+			if phase.max_rss is not None:
+				f.write(f"Max RSS: {phase.max_rss / 1024 ** 2:.1f} MiB\n")
+			f.write("\n")
+			if phase.profiler:
+				phase.profiler.report(f, self.top, path)
+		phase.profiler = None
+
+	def finish(self):
+		if not self.directory:
+			return
+		self.stop()
+		lines = [f"{'phase':<16}{'wall s':>10}{'cpu s':>10}{'blocks':>12}"]
+		for phase in self.phases:
+			lines.append(f"{phase.name:<16}{phase.wall:>10.3f}{phase.cpu:>10.3f}"
+						 f"{phase.blocks:>+12}")
+		summary = "\n".join(lines)
+		with open(os.path.join(self.directory, "summary.txt"), 'w') as f:
+			f.write(summary + "\n")
+		print(f"\nProfile written to {self.directory}\n{summary}")
+		self.directory = None
@@ -0,0 +1,189 @@
+import asyncio, struct
+from dataclasses import replace
+from datetime import datetime, timezone
+
+from asyncua import ua
+from asyncua.common.utils import Buffer
+
+from .write_tap import tap_writes
+
+
+# Log layout: magic, header, then a stream of records. Each browse path is
+# defined once by a PATH record and referred to by its order from WRITE records.
+LOG_MAGIC = b"SIMOPC\x01"
+PATH_RECORD = 0
+WRITE_RECORD = 1
+
+_header = struct.Struct("<?H")		# use_tmc, namespace count
+_string = struct.Struct("<H")		# length of utf-8 string that follows
+_kind = struct.Struct("<B")
+_write = struct.Struct("<dHI")		# sim time, path index, DataValue length
+
+
+def _write_string(f, text):
+	data = text.encode()
+	f.write(_string.pack(len(data)))
+	f.write(data)
+
+
+def _read_string(f):
+	length, = _string.unpack(f.read(_string.size))
+	return f.read(length).decode()
+
+
+class Recorder:
+	"""
+	Writes each (sim time, browse path, DataValue) written by the model to f,
+	a file opened in binary mode. Entries of namespaces left empty are not
+	required on the servers the log is replayed to.
+	"""
+	def __init__(self, f, namespaces, use_tmc=False):
+		self.f = f
+		self.sim_time = 0.0
+		self.paths = {}
+		f.write(LOG_MAGIC)
+		f.write(_header.pack(use_tmc, len(namespaces)))
+		for uri in namespaces:
+			_write_string(f, uri)
+
+	def wrap(self, node, path):
+		return tap_writes(node, path, self.record)
+
+	def set_time(self, event_lines):
+		self.sim_time = float(event_lines[0]['Timestamp'])
+
+	def record(self, path, dv):
+		key = "/".join(path)
+		path_idx = self.paths.get(key)
+		if path_idx is None:
+			path_idx = len(self.paths)
+			self.paths[key] = path_idx
+			self.f.write(_kind.pack(PATH_RECORD))
+			_write_string(self.f, key)
+
+		# Source timestamps are stamped again on replay, keep the log reproducible
+		data = ua.ua_binary.struct_to_binary(replace(dv, SourceTimestamp=None))
+		self.f.write(_kind.pack(WRITE_RECORD))
+		self.f.write(_write.pack(self.sim_time, path_idx, len(data)))
+		self.f.write(data)
+
+	def close(self):
+		self.f.close()
+
+
+def read_header(f):
+	"""Returns (namespace array, use_tmc) of the log in f"""
+	if f.read(len(LOG_MAGIC)) != LOG_MAGIC:
+		raise ValueError(f"{f.name} is not a recorded simulation log")
+	use_tmc, count = _header.unpack(f.read(_header.size))
+	namespaces = [_read_string(f) for _ in range(count)]
+	return namespaces, use_tmc
+
+
+def read_records(f):
+	"""Yields (sim time, path index, path, DataValue) for each write after the header"""
+	paths = []
+	while kind := f.read(_kind.size):
+		if _kind.unpack(kind)[0] == PATH_RECORD:
+			paths.append(_read_string(f).split("/"))
+		else:
+			record = f.read(_write.size)
+			if len(record) < _write.size:
+				break # Log cut short by an interrupted recording
+			sim_time, path_idx, length = _write.unpack(record)
+			data = f.read(length)
+			if len(data) < length:
+				break
+			dv = ua.ua_binary.struct_from_binary(ua.DataValue, Buffer(data))
+			yield sim_time, path_idx, paths[path_idx], dv
+
+
+class ReplayTarget:
+	"""Resolves recorded browse paths and namespace indices for one session"""
+	def __init__(self, session):
+		self.session = session
+		self.nodes = {}
+		self.ns_map = {}
+
+	async def map_namespaces(self, namespaces):
+		target = await self.session.get_namespace_array()
+		for i, uri in enumerate(namespaces):
+			if not uri:
+				continue # Not used by the recorded model
+			if uri not in target:
+				raise ValueError(f"Namespace {uri} used by the log is missing from the target server")
+			self.ns_map[i] = target.index(uri)
+
+	async def get_node(self, path_idx, path):
+		node = self.nodes.get(path_idx)
+		if node is None:
+			browse_path = []
+			for name in path:
+				qname = ua.QualifiedName.from_string(name)
+				browse_path.append(f"{self.ns_map[qname.NamespaceIndex]}:{qname.Name}")
+			node = await self.session.nodes.objects.get_child(browse_path)
+			self.nodes[path_idx] = node
+		return node
+
+	def remap(self, dv):
+		# Custom structures are passed through undecoded, only their type needs moving
+		value = dv.Value.Value
+		if isinstance(value, ua.ExtensionObject) and value.TypeId.NamespaceIndex:
+			typeid = ua.NodeId(value.TypeId.Identifier,
+							   self.ns_map[value.TypeId.NamespaceIndex],
+							   value.TypeId.NodeIdType)
+			dv = replace(dv, Value=replace(dv.Value, Value=replace(value, TypeId=typeid)))
+		return dv
+
+	async def write(self, batch, timestamp):
+		"""Writes a list of (path index, path, DataValue) in one Write service call"""
+		params = ua.WriteParameters()
+		for path_idx, path, dv in batch:
+			node = await self.get_node(path_idx, path)
+			attr = ua.WriteValue()
+			attr.NodeId = node.nodeid
+			attr.AttributeId = ua.AttributeIds.Value
+			attr.Value = replace(self.remap(dv), SourceTimestamp=timestamp)
+			params.NodesToWrite.append(attr)
+		# Server and Client both expose their session interface through their nodes
+		for result in await self.session.nodes.objects.session.write(params):
+			result.check()
+
+
+async def replay_log(f, namespaces, sessions, wait=0, start=0, batch_size=1000):
+	"""
+	f = recorded log, positioned after its header
+	namespaces = namespace array from the log header
+	sessions = list of connected Server/Client objects to write to
+	wait = seconds to wait per timestamp unit
+	start = starting timestamp to fast forward to
+	batch_size = most values sent in one Write call
+
+	Writes sharing a timestamp are sent together, and with no wait
+	consecutive timestamps are merged into the same batch as well.
+	"""
+	targets = [ReplayTarget(session) for session in sessions]
+	for target in targets:
+		await target.map_namespaces(namespaces)
+
+	async def flush():
+		timestamp = datetime.now(timezone.utc)
+		await asyncio.gather(*(target.write(batch, timestamp) for target in targets))
+		batch.clear()
+
+	count = 0
+	batch = []
+	last_time = start
+	for sim_time, path_idx, path, dv in read_records(f):
+		if batch and (len(batch) >= batch_size or wait > 0 and sim_time > last_time):
+			await flush()
+		if sim_time > last_time:
+			await asyncio.sleep(wait * (sim_time - last_time))
+			last_time = sim_time
+		batch.append((path_idx, path, dv))
+		count += 1
+
+	if batch:
+		await flush()
+
+	return count
@@ -0,0 +1,141 @@
+import asyncio, json
+from dataclasses import is_dataclass, fields
+from datetime import datetime
+
+from asyncua import ua
+
+
+class SinkNode:
+	"""Node handle for sinks that are not backed by an OPC UA address space"""
+	def __init__(self, sink, path):
+		self.sink = sink
+		self.path = path
+
+	async def get_child(self, path):
+		path = [path] if isinstance(path, str) else list(path)
+		return SinkNode(self.sink, self.path + path)
+
+	async def write_value(self, value, varianttype=None):
+		await self.sink.write(self.path, value)
+
+	async def read_value(self):
+		return self.sink.read(self.path)
+
+	def __str__(self):
+		return "/".join(self.path)
+
+
+class OpcSink:
+	"""Writes straight to the asyncua Nodes of a connected Server/Client"""
+	async def get_root(self, session, path):
+		return await session.nodes.objects.get_child(path)
+
+	def set_time(self, event_lines):
+		pass
+
+	async def close(self):
+		pass
+
+
+class MemorySink:
+	"""Keeps only the last value written to each path, for benchmarking the engine"""
+	def __init__(self):
+		self.values = {}
+		self.writes = 0
+		self.sim_time = 0.0
+
+	async def get_root(self, session, path):
+		return SinkNode(self, [path])
+
+	def set_time(self, event_lines):
+		self.sim_time = float(event_lines[0]['Timestamp'])
+
+	async def write(self, path, value):
+		self.values["/".join(path)] = value
+		self.writes += 1
+
+	def read(self, path):
+		value = self.values.get("/".join(path))
+		while isinstance(value, (ua.DataValue, ua.Variant)):
+			value = value.Value
+		return value
+
+	async def close(self):
+		print(f"{self.writes} writes to {len(self.values)} paths in memory")
+
+
+def to_plain(value):
+	"""Converts a written value to something json can encode"""
+	if isinstance(value, (ua.DataValue, ua.Variant)):
+		return to_plain(value.Value)
+	if isinstance(value, datetime):
+		return value.isoformat()
+	if isinstance(value, (list, tuple)):
+		return [to_plain(v) for v in value]
+	if is_dataclass(value):
+		return {f.name: to_plain(getattr(value, f.name)) for f in fields(value)}
+	if isinstance(value, bytes):
+		return value.hex()
+	return value
+
+
+def format_line(sim_time, path, value):
+	line = {"t": sim_time, "path": "/".join(path), "value": to_plain(value)}
+	return json.dumps(line) + "\n"
+
+
+class FileSink(MemorySink):
+	"""Writes one json line per value to a file"""
+	def __init__(self, filepath):
+		super().__init__()
+		self.filepath = filepath
+		self.f = None
+
+	async def write(self, path, value):
+		# Opened on the first write so a run that stops early leaves the file alone
+		if self.f is None:
+			self.f = open(self.filepath, 'w')
+		await super().write(path, value)
+		self.f.write(format_line(self.sim_time, path, value))
+
+	async def close(self):
+		if self.f:
+			self.f.close()
+		print(f"{self.writes} writes to {self.filepath}")
+
+
+class UdpSink(MemorySink):
+	"""Sends one json line per value as a UDP datagram"""
+	def __init__(self, host, port):
+		super().__init__()
+		self.address = (host, port)
+		self.transport = None
+
+	async def write(self, path, value):
+		if self.transport is None:
+			loop = asyncio.get_running_loop()
+			self.transport, _ = await loop.create_datagram_endpoint(
+				asyncio.DatagramProtocol, remote_addr=self.address)
+		await super().write(path, value)
+		self.transport.sendto(format_line(self.sim_time, path, value).encode())
+
+	async def close(self):
+		if self.transport:
+			self.transport.close()
+		print(f"{self.writes} writes sent to udp://{self.address[0]}:{self.address[1]}")
+
+
+def make_sink(spec):
+	"""spec = 'opc', 'memory', 'file:PATH' or 'udp:HOST:PORT'"""
+	kind, _, target = spec.partition(":")
+	if kind == "opc":
+		return OpcSink()
+	if kind in {"memory", "null"}:
+		return MemorySink()
+	if kind == "file" and target:
+		return FileSink(target)
+	if kind == "udp":
+		host, _, port = target.rpartition(":")
+		if host and port.isdigit():
+			return UdpSink(host, int(port))
+	raise ValueError(f"Unknown sink '{spec}', expected opc, memory, file:PATH or udp:HOST:PORT")
@@ -0,0 +1,34 @@
+from asyncua.common.ua_utils import value_to_datavalue
+
+
+class WriteTap:
+	"""
+	Stands in for an asyncua Node, passing every value written through it or
+	its children to callback(browse path, DataValue) before writing it
+	"""
+	def __init__(self, node, callback, path):
+		self.node = node
+		self.callback = callback
+		self.path = path
+
+	async def get_child(self, path):
+		path = [path] if isinstance(path, str) else list(path)
+		child = await self.node.get_child(path)
+		return WriteTap(child, self.callback, self.path + path)
+
+	async def write_value(self, value, varianttype=None):
+		dv = value_to_datavalue(value, varianttype)
+		self.callback(self.path, dv)
+		await self.node.write_value(dv)
+
+	def __getattr__(self, name):
+		return getattr(self.node, name)
+
+	def __str__(self):
+		return str(self.node)
+
+
+def tap_writes(node, path, callback):
+	"""Wraps node, found at browse path, in a WriteTap calling callback"""
+	path = [path] if isinstance(path, str) else list(path)
+	return WriteTap(node, callback, path)